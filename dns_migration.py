@@ -1,15 +1,25 @@
+import csv
 import json
 import logging
+import asyncio
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
 from godaddypy import Client, Account
 from godaddypy.client import BadResponse
-import uuid
+import hashlib
 import argparse
 import pandas as pd
-from time import sleep
-from datetime import timedelta, datetime
+import time
+from collections import namedtuple
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import random
+import sys
 
 # Configure logging
 logging.basicConfig(
@@ -23,58 +33,299 @@ logging.basicConfig(
 logger = logging.getLogger('DNSMigration')
 logger.setLevel(logging.DEBUG)
 
+def positive_int(value):
+    '''
+    argparse type for options that must be at least 1.
+    '''
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
 # argparse configuration
 argparser = argparse.ArgumentParser(description='Check DNS records for a domain')
 argparser.add_argument('--domain-list', '-d', default='domains.txt', required=False, help='File containing the list of domains')
 argparser.add_argument('--output', '-o', default='output.csv', required=False, help='Output file for the results')
+argparser.add_argument('--concurrency', '-c', type=positive_int, default=64, required=False, help='Maximum number of domains processed concurrently')
+argparser.add_argument('--checkpoint', default='checkpoint.jsonl', required=False, help='File recording migrated domains so that reruns skip them')
+argparser.add_argument('--no-cache', action='store_true', required=False, help='Fetch DNS records from GoDaddy even if they are cached')
 
+# argparse exits by itself (SystemExit) for --help and invalid arguments
 try:
     opts = argparser.parse_args()
 except Exception as e:
-    logger.error(f"Error parsing arguments: {str(e)}")
+    logger.error("Error parsing arguments: %s", e)
     argparser.print_help()
+    sys.exit(2)
 
 
 DOMAIN_LIST_FILE = opts.domain_list
 OUTPUT_FILE = opts.output
+CONCURRENCY = opts.concurrency
+CHECKPOINT_FILE = opts.checkpoint
+USE_CACHE = not opts.no_cache
+
+# GoDaddy DNS records are cached on disk so reruns do not use up the API limit
+CACHE_DIR = '.cache'
+CACHE_TTL = 24 * 60 * 60 # 24 hours
 
 # Read GoDaddy API credentials from environment variables
 GD_API_KEY = os.environ['GD_API_KEY']
 GD_API_SECRET = os.environ['GD_API_SECRET']
 
 
+class TokenBucket:
+    '''
+    Token bucket rate limiter. Allows bursts of up to capacity calls and
+    refills at rate tokens per second.
+    '''
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        # Concurrent callers queue on the lock so the limit applies to all of them
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        '''
+        Wait until a token is available and consume it.
+        '''
+        async with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                time_to_wait = (1 - self.tokens) / self.rate
+                logger.debug("Waiting for %.2f seconds to avoid API limit", time_to_wait)
+                await asyncio.sleep(time_to_wait)
+                self._refill()
+            self.tokens -= 1
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    '''
+    Token bucket whose refill rate adapts to the API (AIMD). The rate is cut
+    multiplicatively when a call is throttled and raised additively on
+    success, never exceeding the initial rate.
+    '''
+    def __init__(self, capacity: float, rate: float, min_rate: float = 0.1):
+        super().__init__(capacity, rate)
+        self.max_rate = rate
+        self.min_rate = min_rate
+
+    def decrease_rate(self, beta: float = 0.5):
+        self.rate = max(self.min_rate, self.rate * beta)
+        logger.debug("Decreased rate limit to %.2f calls per second", self.rate)
+
+    def increase_rate(self, delta: float = 0.5):
+        self.rate = min(self.max_rate, self.rate + delta)
+
+
+class R53Throttled:
+    '''
+    Wrap a boto3 Route 53 client so that every API call is rate limited by
+    the bucket and retried with backoff when Route 53 throttles it or fails
+    transiently (5xx responses, connection errors). API methods become
+    coroutines and must be called with keyword arguments.
+    '''
+    throttling_errors = ('Throttling', 'ThrottlingException', 'PriorRequestNotComplete')
+    max_attempts = 5
+    # Exponential backoff between attempts, in seconds
+    base_backoff = 0.5
+    max_backoff = 20
+
+    def _is_throttling(self, error: Exception):
+        return isinstance(error, ClientError) and error.response['Error']['Code'] in self.throttling_errors
+
+    def _is_transient(self, error: Exception):
+        if isinstance(error, ClientError):
+            return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+        return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+    def _backoff(self, attempt: int):
+        # Half the delay is fixed and half is random so throttled callers do not retry in lockstep
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def __init__(self, client, bucket: AdaptiveTokenBucket):
+        self.client = client
+        self.bucket = bucket
+
+    @property
+    def exceptions(self):
+        return self.client.exceptions
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(**kwargs):
+            for attempt in range(1, self.max_attempts + 1):
+                await self.bucket.acquire()
+                try:
+                    response = await asyncio.to_thread(method, **kwargs)
+                except (ClientError, BotoConnectionError, HTTPClientError) as e:
+                    throttled = self._is_throttling(e)
+                    if not (throttled or self._is_transient(e)) or attempt == self.max_attempts:
+                        raise
+                    time_to_wait = self._backoff(attempt)
+                    if throttled:
+                        logger.warning("Route 53 throttled %s (attempt %s of %s), retrying in %.2f seconds",
+                                       name, attempt, self.max_attempts, time_to_wait)
+                        self.bucket.decrease_rate()
+                    else:
+                        logger.warning("Route 53 %s failed (attempt %s of %s), retrying in %.2f seconds: %s",
+                                       name, attempt, self.max_attempts, time_to_wait, e)
+                    await asyncio.sleep(time_to_wait)
+                else:
+                    self.bucket.increase_rate()
+                    return response
+
+        return call
+
+
+class PooledClient(Client):
+    '''
+    godaddypy Client that sends its requests through a shared requests.Session
+    so HTTPS connections are kept alive and reused between calls.
+    '''
+    def __init__(self, account, pool_size: int = 50, **kwargs):
+        super().__init__(account, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+        self.session.mount('https://', adapter)
+
+    def _request_submit(self, func, **kwargs):
+        # godaddypy passes module level functions such as requests.get; use the session method of the same name
+        return super()._request_submit(getattr(self.session, func.__name__), **kwargs)
+
+
+def is_rate_limited(error: BadResponse):
+    '''
+    Check if a GoDaddy error response is a rate limit (HTTP 429) response.
+    '''
+    return isinstance(error.message, dict) and error.message.get('code') == 'TOO_MANY_REQUESTS'
+
+
 class GoDaddyClient:
-    wait_time = timedelta(milliseconds=1000) #1 second
+    max_attempts = 5
+
     def __init__(self, client):
         self.client = client
-        self.last_call_time = datetime.now()
-    
-    def _wait_until(self):
-        time_since_last_call = datetime.now() - self.last_call_time
-        if time_since_last_call < self.wait_time:
-            time_to_wait = self.wait_time - time_since_last_call
-            logger.debug(f"Waiting for {time_to_wait} seconds to avoid GoDaddy API limit")
-            sleep(time_to_wait.total_seconds())
-            self.last_call_time = datetime.now()
-
-    def get_records(self, domain):
-        self._wait_until()
-        return self.client.get_records(domain)
+        # GoDaddy allows 60 requests per minute. A full bucket plus a minute of refill
+        # (capacity + 60 * rate) must stay within that.
+        self.bucket = TokenBucket(capacity=30, rate=0.5)
+
+    async def _call(self, method, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            await self.bucket.acquire()
+            try:
+                return await asyncio.to_thread(method, *args, **kwargs)
+            except BadResponse as e:
+                if not is_rate_limited(e) or attempt == self.max_attempts:
+                    raise
+                time_to_wait = e.message.get('retryAfterSec') or 2 ** attempt
+                logger.warning("GoDaddy rate limited %s (attempt %s of %s), retrying in %s seconds",
+                               method.__name__, attempt, self.max_attempts, time_to_wait)
+                await asyncio.sleep(time_to_wait)
+
+    async def get_records(self, domain):
+        return await self._call(self.client.get_records, domain)
     
-    def update_domain(self, domain, **kwargs):
-        self._wait_until()
-        return self.client.update_domain(domain, **kwargs)
+    async def update_domain(self, domain, **kwargs):
+        return await self._call(self.client.update_domain, domain, **kwargs)
 
 # Initialize the GoDaddy client
 gd_account = Account(api_key=GD_API_KEY, api_secret=GD_API_SECRET)
-gd_client = GoDaddyClient(Client(gd_account))
-logger.info(f"GoDaddy API initialized")
+gd_client = GoDaddyClient(PooledClient(gd_account, pool_size=CONCURRENCY))
+logger.info("GoDaddy API initialized")
+
+# Route 53 allows 5 requests per second per account
+# R53Throttled retries throttling and transient errors; botocore must not retry calls on its
+# own or the throttling errors never reach the adaptive token bucket
+r53_config = Config(max_pool_connections=CONCURRENCY, retries={'total_max_attempts': 1, 'mode': 'standard'})
+r53_client = R53Throttled(boto3.client('route53', config=r53_config), AdaptiveTokenBucket(capacity=5, rate=5))
+logger.info("Route 53 client initialized")
+
+# Ids of the existing public hosted zones by domain name, filled in by load_r53_zones
+r53_zones = {}
+
+
+class Record(namedtuple('Record', 'name type data ttl priority')):
+    '''
+    A DNS record from GoDaddy. Kept as a tuple because a dict per record takes
+    several times more memory across large batches of domains.
+    '''
+    __slots__ = ()
 
-r53_client = boto3.client('route53')
-logger.info(f"Route 53 client initialized")
+    @classmethod
+    def from_godaddy(cls, record):
+        return cls(record['name'], record['type'], record['data'], record.get('ttl', 3600), record.get('priority', 0))
+
+
+# Record types that Route 53 creates itself for every hosted zone
+SKIP_TYPES = frozenset({'SOA', 'NS'})
+
+
+# GoDaddy Website Builder sites are served from a fixed address
+WEBSITE_BUILDER_IP = '76.223.105.230'
+
+# Actions for GoDaddy records that need special handling, keyed by (type, name, data).
+# None matches any name or data.
+SPECIAL_RECORDS = {
+    # GoDaddy placeholders that should not be migrated
+    ('CNAME', '_domainconnect', None): 'skip',
+    ('A', None, 'Parked'): 'skip',
+    # Route 53 does not support @ as a CNAME target
+    ('CNAME', None, '@'): 'rewrite_to_apex',
+    ('A', None, 'WebsiteBuilder Site'): 'rewrite_to_ip',
+}
+
+
+def special_record_action(record):
+    '''
+    Find the action for a GoDaddy record that needs special handling.
+    :param record: A DNS record from GoDaddy.
+    :return: The action from SPECIAL_RECORDS, or None if the record needs none.
+    '''
+    return (SPECIAL_RECORDS.get((record.type, record.name, None))
+            or SPECIAL_RECORDS.get((record.type, None, record.data)))
+
+
+def transform_mx(record):
+    return f"{record.priority} {record.data}"
+
+
+def transform_txt(record):
+    # Enclose TXT record values in double quotes
+    return f'"{record.data}"'
+
+
+def transform_srv(record):
+    # Ensure SRV records are correctly formatted
+    if len(record.data.split()) != 4:
+        return None
+    return record.data
+
+
+# Functions converting a GoDaddy record's data to its Route 53 value, by record type.
+# They return None when the record is invalid and must be skipped.
+TRANSFORMS = {
+    'MX': transform_mx,
+    'TXT': transform_txt,
+    'SRV': transform_srv,
+}
 
 
 class Domain:
+    # A ChangeResourceRecordSets request may contain at most 1,000 record values and
+    # 32,000 characters of values, and the values of an UPSERT count twice
+    r53_max_batch_values = 500
+    r53_max_batch_chars = 16000
+
     def __init__(self, name: str):
         '''
         Initialize the Domain object with the given name.
@@ -82,38 +333,69 @@ class Domain:
         '''
         self.name = name.lower().strip()
         self._r53_zone_id = None
-        self.index = None
         self._records = None
+        self._nameservers = None
+
+    async def fetch_records(self):
+        '''
+        Fetch the DNS records for the domain from GoDaddy, or from the on-disk
+        cache if they were fetched less than CACHE_TTL seconds ago.
+        :return: A list of DNS records
+        '''
+        if self._records is None:
+            records = self._read_cached_records() if USE_CACHE else None
+            if records is None:
+                try:
+                    records = await gd_client.get_records(self.name)
+                    self._write_cached_records(records)
+                except BadResponse as e:
+                    # Being rate limited says nothing about the domain's records
+                    if is_rate_limited(e):
+                        raise
+                    records = []
+            self._records = [Record.from_godaddy(record) for record in records]
+        return self._records
 
     @property
-    def records(self):
+    def _cache_file(self):
+        return os.path.join(CACHE_DIR, f"{self.name}.json")
+
+    def _read_cached_records(self):
         try:
-            if not self._records:
-                self._records = gd_client.get_records(self.name)
-        except BadResponse as e:
-            self._records = []
-        return self._records
-    
+            with open(self._cache_file, 'r') as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if time.time() - entry['t'] >= CACHE_TTL:
+            return None
+
+        logger.debug("Using cached GoDaddy DNS records for %s", self.name)
+        return entry['records']
+
+    def _write_cached_records(self, records):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(self._cache_file, 'w') as file:
+                json.dump({'t': time.time(), 'records': records}, file)
+        except OSError as e:
+            logger.warning("Error caching GoDaddy DNS records for %s: %s", self.name, e)
+
+    @property
+    def records(self):
+        '''
+        The DNS records previously fetched from GoDaddy with fetch_records or
+        prefetch_records.
+        '''
+        return self._records or []
+
     @property
     def r53_zone_id(self):
         '''
         Get the Route 53 hosted zone id for the domain.
         :return: The hosted zone id
         '''
-        if self._r53_zone_id:
-            return self._r53_zone_id
-
-        try:
-            hosted_zones = r53_client.list_hosted_zones_by_name(DNSName=self.name)
-            for zone in hosted_zones['HostedZones']:
-                if zone['Name'] == self.name + '.':
-                    self._r53_zone_id = zone['Id']
-                    break
-
-        except r53_client.exceptions.InvalidInput or r53_client.exceptions.InvalidDomainName:
-            logger.error(f"Zone {self.name} is not valid")
-
-        return self._r53_zone_id
+        return self._r53_zone_id or r53_zones.get(self.name)
 
     @r53_zone_id.setter
     def r53_zone_id(self, value: str):
@@ -125,10 +407,10 @@ class Domain:
         :return: True if the domain has DNS records in GoDaddy, False otherwise.
         '''
         if len(self.records) > 0:
-            logger.info(f"Domain {self.name} has DNS records in GoDaddy")
+            logger.info("Domain %s has DNS records in GoDaddy", self.name)
             return True
 
-        logger.info(f"Domain {self.name} does not have DNS records in GoDaddy")
+        logger.info("Domain %s does not have DNS records in GoDaddy", self.name)
         return False
        
         
@@ -143,29 +425,29 @@ class Domain:
         domain_parked = False
 
         for record in self.records:
-            if record['name'] == '@' and record['type'] == 'A' and record['data'] == 'Parked':
+            if record.name == '@' and record.type == 'A' and record.data == 'Parked':
                 domain_parked = True
         
         if not domain_parked:
-            logger.info(f"Domain {self.name} requires zone migration: apex record is not parked")
+            logger.info("Domain %s requires zone migration: apex record is not parked", self.name)
             return True
 
         if len(self.records) <= 6:
-            logger.info(f"Domain {self.name} requires zone migration: more than the default 5 records found")
+            logger.info("Domain %s requires zone migration: more than the default 5 records found", self.name)
             return True
     
         return False
 
-    def gd_update_nameservers(self, nameservers: list[str]):
+    async def gd_update_nameservers(self, nameservers: list[str]):
         '''
         Update the NS records for the domain in GoDaddy
         :return: True on success, False otherwise
         '''
         try:
-            gd_client.update_domain(self.name, nameServers = nameservers )
-            logger.info(f"Updated NS records for {self.name} in GoDaddy to {nameservers}")
+            await gd_client.update_domain(self.name, nameServers = nameservers )
+            logger.info("Updated NS records for %s in GoDaddy to %s", self.name, nameservers)
         except Exception as e:
-            logger.error(f"Error updating NS records for {self.name} in GoDaddy: {str(e)}")
+            logger.error("Error updating NS records for %s in GoDaddy: %s", self.name, e)
             return False
         
         return True
@@ -176,133 +458,203 @@ class Domain:
         :return: True if the zone exists, False otherwise.
         '''
         if self.r53_zone_id:
-            logger.debug(f"Route 53 hosted zone for {self.name} already exists")
+            logger.debug("Route 53 hosted zone for %s already exists", self.name)
             return True
 
-        logger.debug(f"Route 53 hosted zone for {self.name} does not exist")
+        logger.debug("Route 53 hosted zone for %s does not exist", self.name)
         return False
 
-    def r53_get_nameservers(self):
+    async def r53_get_nameservers(self):
         '''
         Get the nameservers for the domain from Route 53.
         :return: A list of nameservers
         '''
+        # Zones created by this run already returned their nameservers
+        if self._nameservers:
+            return self._nameservers
+
         nameservers = []
         try:
-            response = r53_client.get_hosted_zone(Id=self.r53_zone_id)
+            response = await r53_client.get_hosted_zone(Id=self.r53_zone_id)
             nameservers = response['DelegationSet']['NameServers']
         except Exception as e:
-            logger.error(f"Error getting nameservers for {self.name} from Route 53: {str(e)}")
+            logger.error("Error getting nameservers for %s from Route 53: %s", self.name, e)
 
         return nameservers
 
-    def r53_create_zone(self):
+    @property
+    def r53_caller_reference(self):
+        '''
+        The CallerReference for creating the domain's hosted zone. It is the same
+        for every attempt on a given day, so when r53_client retries a request
+        whose response was lost, or a duplicate input row or a rerun on the same
+        day creates the zone again, Route 53 answers HostedZoneAlreadyExists and
+        the existing zone is looked up instead of a second one being created.
+        The date changes at midnight, so a retry spanning midnight is not
+        protected; a later run only avoids a duplicate because the zone already
+        shows up in r53_zones. A deleted zone can still be created again later.
+        '''
+        return hashlib.sha256(f"{self.name}:{date.today().isoformat()}".encode()).hexdigest()[:32]
+
+    async def r53_find_zone(self):
+        '''
+        Look up the Route 53 hosted zone id for the domain, e.g. for a zone
+        created by an earlier attempt whose response was lost.
+        :return: The hosted zone id
+        '''
+        try:
+            response = await r53_client.list_hosted_zones_by_name(DNSName=self.name)
+            for zone in response['HostedZones']:
+                # Private zones with the same name are listed alongside the public one
+                if zone['Name'] == self.name + '.' and not zone.get('Config', {}).get('PrivateZone'):
+                    self.r53_zone_id = zone['Id']
+                    r53_zones[self.name] = self.r53_zone_id
+                    break
+        except Exception as e:
+            logger.error("Error looking up Route 53 hosted zone for %s: %s", self.name, e)
+
+        return self.r53_zone_id
+
+    async def r53_create_zone(self):
         '''
         Create a new Route 53 hosted zone for the domain.
         :return: The hosted zone id
         '''
-        logger.debug(f"Creating Route 53 hosted zone for {self.name}")
+        logger.debug("Creating Route 53 hosted zone for %s", self.name)
         try:
-            response = r53_client.create_hosted_zone(
+            response = await r53_client.create_hosted_zone(
                 Name=self.name,
-                CallerReference=str(uuid.uuid4())
+                CallerReference=self.r53_caller_reference
             )
-            logger.info(f"Created Route 53 hosted zone for {self.name} with id {response['HostedZone']['Id']}")
+            logger.info("Created Route 53 hosted zone for %s with id %s", self.name, response['HostedZone']['Id'])
             self.r53_zone_id = response['HostedZone']['Id']
+            r53_zones[self.name] = self.r53_zone_id
+            self._nameservers = response['DelegationSet']['NameServers']
 
         except r53_client.exceptions.HostedZoneAlreadyExists:
-            logger.info(f"Route 53 hosted zone for {self.name} already exists")
+            logger.info("Route 53 hosted zone for %s already exists", self.name)
+            await self.r53_find_zone()
+        except (r53_client.exceptions.InvalidInput, r53_client.exceptions.InvalidDomainName):
+            logger.error("Zone %s is not valid", self.name)
         except Exception as e:
-            logger.error(f"Error creating Route 53 hosted zone for {self.name}: {str(e)}")
+            logger.error("Error creating Route 53 hosted zone for %s: %s", self.name, e)
     
-        logger.debug(f"Route 53 hosted zone for {self.name} is {self.r53_zone_id}")
+        logger.debug("Route 53 hosted zone for %s is %s", self.name, self.r53_zone_id)
         return self.r53_zone_id
     
     def has_mx_records(self):
         for record in self.records:
-            if record['type'] == 'MX':
+            if record.type == 'MX':
                 return True
         
         return False
 
-    def r53_create_records(self):
+    def r53_change_batches(self, changes):
+        '''
+        Split UPSERT changes into batches within Route 53's per-request limits.
+        A record set is never split across batches.
+        :param changes: The list of changes for the ChangeResourceRecordSets API.
+        :return: A list of batches, each a list of changes
+        '''
+        batches = []
+        batch, batch_values, batch_chars = [], 0, 0
+        for change in changes:
+            values = [record['Value'] for record in change['ResourceRecordSet']['ResourceRecords']]
+            chars = sum(len(value) for value in values)
+            if batch and (batch_values + len(values) > self.r53_max_batch_values
+                          or batch_chars + chars > self.r53_max_batch_chars):
+                batches.append(batch)
+                batch, batch_values, batch_chars = [], 0, 0
+
+            batch.append(change)
+            batch_values += len(values)
+            batch_chars += chars
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def r53_create_records(self):
         '''
         Create DNS records in Route 53 for the domain.
-        :return: True on success, False otherwise
+        :return: A list of ChangeResourceRecordSets responses, one per batch
         '''
 
         # Dictionary to aggregate records by name and type
         aggregated_records = {}
 
         for record in self.records:
-            if record['type'] in ['SOA', 'NS']:
-                continue
-
-            if record['type'] == 'A' and record['data'] == 'Parked':
+            if record.type in SKIP_TYPES:
                 continue
 
-            if record['type'] == 'CNAME' and record['name'] == '_domainconnect':
+            action = special_record_action(record)
+            if action == 'skip':
                 continue
 
-            if record['type'] == 'CNAME' and record['data'] == '@':
-                record['data'] = self.name
-
-            if record['type'] == 'A' and record['data'] == 'WebsiteBuilder Site':
-                record['data'] = '76.223.105.230'
-
             # AWS does not support the @ symbol to represent the apex
-            if record['name'] == '@':
-                record['name'] = self.name
+            if record.name == '@':
+                name = self.name
             else:
                 # All records must contain the FQDN
-                record['name'] = record['name'] + '.' + self.name
+                name = record.name + '.' + self.name
 
-            if record['type'] == 'MX':
-                record['data'] =  f"{record['priority']} {record['data']}"
-
-            # Enclose TXT record values in double quotes
-            if record['type'] == 'TXT':
-                record['data'] = f'"{record["data"]}"'
+            if action == 'rewrite_to_apex':
+                data = self.name
+            elif action == 'rewrite_to_ip':
+                data = WEBSITE_BUILDER_IP
+            else:
+                transform = TRANSFORMS.get(record.type)
+                data = transform(record) if transform else record.data
 
-            # Ensure SRV records are correctly formatted
-            if record['type'] == 'SRV':
-                if len(record['data'].split()) != 4:
-                    logger.error(f"Invalid SRV record data for {record['name']}: {record['data']}")
-                    continue
+            if data is None:
+                logger.error("Invalid %s record data for %s: %s", record.type, name, record.data)
+                continue
 
             # Aggregate records by name and type
-            key = (record['name'], record['type'])
+            key = (name, record.type)
             if key not in aggregated_records:
                 aggregated_records[key] = {
-                    'Name': record['name'],
-                    'Type': record['type'],
-                    'TTL': record['ttl'],
-                    'ResourceRecords': []
+                    'Name': name,
+                    'Type': record.type,
+                    'TTL': record.ttl,
+                    'ResourceRecords': set()
                 }
             
-            # Add the data to the aggregated records
-            aggregated_records[key]['ResourceRecords'].append({'Value': record['data']})
+            # Add the data to the aggregated records, Route 53 rejects duplicate values
+            aggregated_records[key]['ResourceRecords'].add(data)
 
         # Prepare the changes list for the ChangeResourceRecordSets API
         changes = [
             {
                 'Action': 'UPSERT',
-                'ResourceRecordSet': aggregated_record
+                'ResourceRecordSet': {
+                    **aggregated_record,
+                    'ResourceRecords': [{'Value': value} for value in sorted(aggregated_record['ResourceRecords'])]
+                }
             }
             for aggregated_record in aggregated_records.values()
         ]
 
-        logger.debug(f"Creating DNS records for {self.name} in Route 53: {changes}")
-
-        # Perform the batch update (create or update records)
-        response = r53_client.change_resource_record_sets(
-            HostedZoneId=self.r53_zone_id,
-            ChangeBatch={
-                'Changes': changes
-            }
-        )
+        # The change batch can be large, only format it when it will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Creating DNS records for %s in Route 53: %s", self.name, changes)
+
+        batches = self.r53_change_batches(changes)
+        if len(batches) > 1:
+            logger.warning("Domain %s has too many record values for one change batch, splitting into %s batches", self.name, len(batches))
+
+        # Perform the batch updates (create or update records)
+        responses = []
+        for batch in batches:
+            response = await r53_client.change_resource_record_sets(
+                HostedZoneId=self.r53_zone_id,
+                ChangeBatch={
+                    'Changes': batch
+                }
+            )
+            responses.append(response)
 
-        return response
+        return responses
 
 # Read domains from file and process them
 def get_domains_list(file_path):
@@ -317,45 +669,192 @@ def get_domains_list(file_path):
         
         return domains
     except FileNotFoundError:
-        logger.error(f"File not found: {file_path}")
+        logger.error("File not found: %s", file_path)
     except Exception as e:
-        logger.error(f"An error occurred while processing domains: {str(e)}")
+        logger.error("An error occurred while processing domains: %s", e)
     
     return []
 
+def load_checkpoint(file_path):
+    '''
+    Read the domains migrated by previous runs from the checkpoint file.
+    :param file_path: The path to the checkpoint file.
+    :return: A dictionary of domain names to checkpoint entries.
+    '''
+    migrated = {}
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as file:
+            lines = file.readlines()
+
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            # A crash while appending can leave a truncated last line
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping invalid line %s in %s", line_number, file_path)
+                continue
+            migrated[entry['name']] = entry
+
+        # Terminate a truncated last line so new entries are not appended to it
+        if lines and not lines[-1].endswith('\n'):
+            with open(file_path, 'a') as file:
+                file.write('\n')
+
+    logger.info("Found %s migrated domains in %s", len(migrated), file_path)
+    return migrated
+
+def save_checkpoint(file_path, domain):
+    '''
+    Append a migrated domain to the checkpoint file.
+    :param file_path: The path to the checkpoint file.
+    :param domain: The migrated Domain object.
+    '''
+    with open(file_path, 'a') as file:
+        file.write(json.dumps({'name': domain.name, 'zone': domain.r53_zone_id, 'mx': domain.has_mx_records()}) + '\n')
+
+def checkpoint_result(entry):
+    '''
+    Build the results for a domain migrated by a previous run.
+    :param entry: The domain's checkpoint entry.
+    :return: A dictionary with the results for the domain's output columns.
+    '''
+    return {
+        'Has GoDaddy DNS': 'Yes',
+        'Requires DNS Migration': 'Yes',
+        'AWS Zone ID': entry['zone'],
+        'AWS DNS Records Created': 'Yes',
+        'Supports Email': "Yes" if entry.get('mx') else "No",
+    }
+
+# Output columns, in order
+RESULT_COLUMNS = ['Has GoDaddy DNS', 'Requires DNS Migration', 'AWS Zone ID', 'AWS DNS Records Created', 'Supports Email']
+
+async def process_domain(domain, semaphore, migrated):
+    '''
+    Migrate a single domain to Route 53.
+    :param domain: The Domain object to process.
+    :param semaphore: Semaphore bounding the number of domains processed concurrently.
+    :param migrated: Domains migrated by previous runs, mapped to their checkpoint entries.
+    :return: A dictionary with the results for the domain's output columns.
+    '''
+    async with semaphore:
+        if domain.name in migrated:
+            logger.info("Domain %s was migrated by a previous run, skipping", domain.name)
+            return checkpoint_result(migrated[domain.name])
+
+        logger.info("Processing domain: %s", domain.name)
+        result = {
+            'Requires DNS Migration': 'No',
+            'AWS Zone ID': None,
+            'AWS DNS Records Created': 'No',
+        }
+        # An error in one domain must not abort the other domains in the run
+        try:
+            # Only fetches the records if prefetching them failed
+            await domain.fetch_records()
+
+            if domain.requires_zone_migration():
+                result['Requires DNS Migration'] = 'Yes'
+
+                if not domain.r53_zone_exists():
+                    await domain.r53_create_zone()
+
+                # Skip the domain if the zone could not be created
+                if domain.r53_zone_exists():
+                    result['AWS Zone ID'] = domain.r53_zone_id
+                    await domain.r53_create_records()
+                    result['AWS DNS Records Created'] = 'Yes'
+
+                    nameservers = await domain.r53_get_nameservers()
+                    if nameservers and await domain.gd_update_nameservers(nameservers):
+                        save_checkpoint(CHECKPOINT_FILE, domain)
+        except Exception as e:
+            logger.error("Error processing domain %s: %s", domain.name, e)
+            result['AWS DNS Records Created'] = 'Error'
+
+        return result
+
+async def load_r53_zones():
+    '''
+    Look up all existing public hosted zones once instead of once per domain.
+    The pages are fetched through r53_client so they are throttled and retried.
+    '''
+    params = {}
+    while True:
+        response = await r53_client.list_hosted_zones(**params)
+        for zone in response['HostedZones']:
+            # Records must never be migrated into a private zone with the same name
+            if zone.get('Config', {}).get('PrivateZone'):
+                continue
+            r53_zones.setdefault(zone['Name'].rstrip('.'), zone['Id'])
+
+        if not response['IsTruncated']:
+            break
+        params['Marker'] = response['NextMarker']
+
+    logger.info("Found %s Route 53 hosted zones", len(r53_zones))
+
+async def prefetch_records(domains):
+    '''
+    Fetch the GoDaddy DNS records of all domains concurrently, at most CONCURRENCY at a time.
+    :param domains: The list of Domain objects.
+    '''
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def fetch(domain):
+        async with semaphore:
+            try:
+                await domain.fetch_records()
+            except Exception as e:
+                # process_domain retries the fetch and reports the error for the domain
+                logger.warning("Error fetching GoDaddy DNS records for %s: %s", domain.name, e)
+
+    await asyncio.gather(*(fetch(domain) for domain in domains))
+
+async def process_domains(domains, migrated):
+    '''
+    Process all domains concurrently, at most CONCURRENCY at a time. The GoDaddy
+    DNS records of every domain are fetched before any domain is processed,
+    except for domains migrated by previous runs, which make no API calls.
+    :param domains: The list of Domain objects to process.
+    :param migrated: Domains migrated by previous runs, mapped to their checkpoint entries.
+    :return: A list of result dictionaries in the same order as domains.
+    '''
+    # The blocking godaddypy and boto3 calls run in the default executor through asyncio.to_thread.
+    # Its default size (at most 32, fewer on small machines) would otherwise cap the concurrency.
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=CONCURRENCY))
+    await asyncio.gather(
+        load_r53_zones(),
+        prefetch_records([domain for domain in domains if domain.name not in migrated]),
+    )
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    return await asyncio.gather(*(process_domain(domain, semaphore, migrated) for domain in domains))
+
 if __name__ == "__main__":
     #domains = get_domains_list(DOMAIN_LIST_FILE)
-    domains = []
-    domains_data = pd.read_csv(DOMAIN_LIST_FILE)
-    
-    # iterate over domains and print each name
-    for index, row in domains_data.iterrows():
-        domain = Domain(row['Name'])
-        domain.index = index
-        domains.append(domain)
-
-    for domain in domains:
-        logger.info(f"Processing domain: {domain.name}")
-        domains_data.at[domain.index, 'Has GoDaddy DNS'] = "Yes" if domain.gd_dns_exists() else "No"
-        if domain.requires_zone_migration():
-            domains_data.at[domain.index, 'Requires DNS Migration'] = 'Yes'
-            
-            if not domain.r53_zone_exists():
-                domain.r53_create_zone()
-            
-            domains_data.at[domain.index, 'AWS Zone ID'] = domain.r53_zone_id
-            domain.r53_create_records()
-            domains_data.at[domain.index, 'AWS DNS Records Created'] = 'Yes'
-
-            nameservers = domain.r53_get_nameservers()
-            if nameservers:
-                domain.gd_update_nameservers(nameservers)
-        else:
-            domains_data.at[domain.index, 'Requires DNS Migration'] = 'No'
-            domains_data.at[domain.index, 'AWS DNS Records Created'] = 'No'
-        
-        domains_data.at[domain.index, 'Supports Email'] = "Yes" if domain.has_mx_records() else "No"
+    with open(DOMAIN_LIST_FILE, newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        rows = list(reader)
+    domains = [Domain(row['Name']) for row in rows]
+
+    migrated = load_checkpoint(CHECKPOINT_FILE)
+    results = asyncio.run(process_domains(domains, migrated))
+
+    # Build the output in one pass, keeping the input columns and replacing any previous results
+    domains_data = pd.DataFrame(rows, columns=reader.fieldnames)
+    results_data = pd.DataFrame(results, columns=RESULT_COLUMNS, dtype=object)
+
+    # Columns that only depend on the GoDaddy records are computed in one pass once all domains are processed.
+    # Domains skipped because of the checkpoint already have them.
+    processed = pd.Series([domain.name not in migrated for domain in domains], dtype=bool)
+    processed_domains = pd.Series(domains, dtype=object)[processed]
+    results_data.loc[processed, 'Has GoDaddy DNS'] = processed_domains.map(lambda domain: "Yes" if domain.records else "No")
+    results_data.loc[processed, 'Supports Email'] = processed_domains.map(lambda domain: "Yes" if domain.has_mx_records() else "No")
+    domains_data = domains_data.drop(columns=results_data.columns, errors='ignore').join(results_data)
     
     domains_data.to_csv(OUTPUT_FILE, index=False)
-    logger.info(f"Domains processed: {os.linesep} {domains_data}")
+    logger.info("Domains processed: %s %s", os.linesep, domains_data)
     logger.info("Script execution completed.")